@@ -0,0 +1,8 @@
+import os
+from dotenv import load_dotenv
+
+# Load the .env file once; other modules read the tokens from here
+load_dotenv()
+
+GOTIFY_TOKEN = os.environ.get('GOTIFY_TOKEN')
+SLACK_TOKEN = os.environ.get('SLACK_TOKEN')
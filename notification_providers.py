@@ -1,36 +1,92 @@
-import os
 import logging
+import threading
 import requests
 from abc import ABC, abstractmethod
-from dotenv import load_dotenv
+from concurrent.futures import Future, ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from env import GOTIFY_TOKEN, SLACK_TOKEN
 
 logger = logging.getLogger(__name__)
-load_dotenv()
+
+# (connect, read) timeout in seconds for notification requests
+REQUEST_TIMEOUT = (3.05, 10)
+# Worker threads dispatching notifications in the background
+MAX_NOTIFICATION_WORKERS = 4
+# Notifications allowed to wait for a worker before callers block
+MAX_PENDING_NOTIFICATIONS = 100
+# Slack accepts at most 50 blocks per message, and each notification uses two
+SLACK_NOTIFICATIONS_PER_MESSAGE = 25
+
+def create_session(headers: dict) -> requests.Session:
+    """Create a pooled session so repeated notifications reuse the connection"""
+    session = requests.Session()
+    session.headers.update(headers)
+    # Only failed connection attempts are retried; the request never reached the server,
+    # so retrying can't send a duplicate alert. Error responses to the POST are not retried.
+    retries = Retry(total=3, backoff_factor=0.3)
+    session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=10, max_retries=retries))
+    return session
 
 class NotificationProvider(ABC):
+    session: requests.Session = None
+    # Created on first use, so subclasses don't need to call super().__init__()
+    _executor: ThreadPoolExecutor = None
+    _pending: threading.BoundedSemaphore = None
+
     @abstractmethod
     def send_notification(self, title: str, message: str) -> bool:
         pass
 
+    def _submit(self, fn, *args) -> Future:
+        """Run fn on a worker thread and return without waiting for it"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=MAX_NOTIFICATION_WORKERS)
+            self._pending = threading.BoundedSemaphore(MAX_PENDING_NOTIFICATIONS)
+        # Blocks once too many notifications are queued, so an outage can't grow memory unbounded
+        self._pending.acquire()
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(lambda _: self._pending.release())
+        return future
+
+    def send_async(self, title: str, message: str) -> Future:
+        """Queue a notification on a worker thread and return without waiting for it"""
+        return self._submit(self.send_notification, title, message)
+
+    def send_batch(self, items: list) -> list:
+        """Queue several (title, message) notifications, returning their futures"""
+        return [self.send_async(title, message) for title, message in items]
+
+    def close(self):
+        """Wait for queued notifications to finish and release pooled connections"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        if self.session is not None:
+            self.session.close()
+
 class GotifyProvider(NotificationProvider):
     def __init__(self, url: str, token: str):
         self.url = url.rstrip('/')
         self.token = token
+        self.session = create_session({"X-Gotify-Key": token})
 
     def send_notification(self, title: str, message: str) -> bool:
         try:
-            response = requests.post(
+            response = self.session.post(
                 f"{self.url}/message",
                 json={
                     "title": title,
                     "message": message,
                     "priority": 5
                 },
-                headers={"X-Gotify-Key": self.token}
+                timeout=REQUEST_TIMEOUT
             )
             response.raise_for_status()
             logger.info("Notification sent successfully")
             return True
+        except requests.exceptions.Timeout as e:
+            logger.error(f"Timed out sending notification: {e}")
+            return False
         except Exception as e:
             logger.error(f"Failed to send notification: {e}")
             return False
@@ -39,39 +95,54 @@ class SlackProvider(NotificationProvider):
     def __init__(self, token: str, channel: str = '#monitoring'):
         self.token = token
         self.channel = channel
+        self.session = create_session({
+            'Authorization': f'Bearer {token}',
+            'Content-Type': 'application/json'
+        })
+
+    @staticmethod
+    def _format_blocks(title: str, message: str) -> list:
+        """Format a notification as a Slack header and section block"""
+        return [
+            {
+                "type": "header",
+                "text": {
+                    "type": "plain_text",
+                    "text": title
+                }
+            },
+            {
+                "type": "section",
+                "text": {
+                    "type": "mrkdwn",
+                    # Quote every line of the message as a mrkdwn blockquote
+                    "text": "> " + "\n> ".join(message.strip().splitlines())
+                }
+            }
+        ]
 
     def send_notification(self, title: str, message: str) -> bool:
+        return self._post_blocks(self._format_blocks(title, message))
+
+    def send_batch(self, items: list) -> list:
+        """Queue several (title, message) notifications, coalesced into as few Slack messages as possible"""
+        futures = []
+        for start in range(0, len(items), SLACK_NOTIFICATIONS_PER_MESSAGE):
+            blocks = []
+            for title, message in items[start:start + SLACK_NOTIFICATIONS_PER_MESSAGE]:
+                blocks.extend(self._format_blocks(title, message))
+            futures.append(self._submit(self._post_blocks, blocks))
+        return futures
+
+    def _post_blocks(self, blocks: list) -> bool:
         try:
-            headers = {
-                'Authorization': f'Bearer {self.token}',
-                'Content-Type': 'application/json'
-            }
-            
-            # Format message for Slack
-            blocks = [
-                {
-                    "type": "header",
-                    "text": {
-                        "type": "plain_text",
-                        "text": title
-                    }
-                },
-                {
-                    "type": "section",
-                    "text": {
-                        "type": "mrkdwn",
-                        "text": message.replace('\n', '\n>')
-                    }
-                }
-            ]
-            
-            response = requests.post(
+            response = self.session.post(
                 'https://slack.com/api/chat.postMessage',
-                headers=headers,
                 json={
                     'channel': self.channel,
                     'blocks': blocks
-                }
+                },
+                timeout=REQUEST_TIMEOUT
             )
             
             response.raise_for_status()
@@ -82,6 +153,9 @@ class SlackProvider(NotificationProvider):
             
             logger.info("Slack notification sent successfully")
             return True
+        except requests.exceptions.Timeout as e:
+            logger.error(f"Timed out sending Slack notification: {e}")
+            return False
         except Exception as e:
             logger.error(f"Failed to send Slack notification: {e}")
             return False
@@ -92,13 +166,13 @@ def get_notification_provider(config: dict) -> NotificationProvider:
     
     if provider_type == 'gotify':
         gotify_url = config.get('notifications', {}).get('gotify', {}).get('url')
-        token = os.getenv('GOTIFY_TOKEN')
+        token = GOTIFY_TOKEN
         if not gotify_url or not token:
             raise ValueError("Gotify URL and token are required for Gotify notifications")
         return GotifyProvider(gotify_url, token)
     
     elif provider_type == 'slack':
-        token = os.getenv('SLACK_TOKEN')
+        token = SLACK_TOKEN
         channel = config.get('notifications', {}).get('slack', {}).get('channel', '#monitoring')
         if not token:
             raise ValueError("Slack token is required for Slack notifications")
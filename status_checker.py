@@ -2,15 +2,42 @@
 import os
 import logging
 import requests
-import json
 from datetime import datetime
 import argparse
-import copy
+import functools
+import hashlib
 import time
 import yaml
-from dotenv import load_dotenv
+from dataclasses import dataclass, field
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from notification_providers import get_notification_provider
 
+# Use libyaml's C loader when PyYAML was built with it
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+# orjson is considerably faster than the stdlib json module, but optional
+try:
+    import orjson
+
+    def json_loads(data):
+        return orjson.loads(data)
+
+    def json_dumps(obj):
+        # OPT_NON_STR_KEYS coerces keys to strings like the stdlib json module does
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+except ImportError:
+    import json
+
+    def json_loads(data):
+        return json.loads(data)
+
+    def json_dumps(obj):
+        return json.dumps(obj, indent=2, sort_keys=True).encode()
+
 # Default message templates
 DEFAULT_DEGRADATION_TITLE = "🔴 Issue with {name}"
 DEFAULT_DEGRADATION_MESSAGE = """
@@ -35,6 +62,50 @@ Component: {name}
 Current Status: {status}
 """
 
+class _SafeDict(dict):
+    """Format parameters that render missing placeholders as an empty string"""
+    def __missing__(self, key):
+        return ""
+
+# Bound formatters for the default templates, looked up once at import
+_DEGRADATION_FMT = DEFAULT_DEGRADATION_MESSAGE.format_map
+_RECOVERY_FMT = DEFAULT_RECOVERY_MESSAGE.format_map
+_NEW_ISSUE_FMT = DEFAULT_NEW_ISSUE_MESSAGE.format_map
+
+DEFAULT_NOTIFY_ON = frozenset(("degradation", "recovery"))
+
+@dataclass(slots=True, frozen=True)
+class CompCfg:
+    """Notification settings for a single component, pre-processed from config.yaml"""
+    enabled: bool = True
+    notify_on: frozenset = DEFAULT_NOTIFY_ON
+    messages: dict = field(default_factory=dict)
+
+# Settings used for components that are not listed in config.yaml
+DEFAULT_COMP_CFG = CompCfg()
+
+@dataclass(slots=True, frozen=True)
+class ComponentStatus:
+    """A component from the status API, normalised once alongside its previous state"""
+    id: str
+    name: str
+    status: str
+    prev_status: str | None
+    is_operational: bool
+    # None when the component was not in the previous state
+    was_operational: bool | None
+
+# Notification event for each (was operational, is operational) pair;
+# None as the previous value means the component was not seen before
+_TRANSITIONS = {
+    (True, False): "degradation",
+    (False, True): "recovery",
+    (True, True): None,
+    (False, False): None,
+    (None, False): "degradation",
+    (None, True): None,
+}
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -46,36 +117,45 @@ logging.basicConfig(
 )
 logger = logging.getLogger('status_checker')
 
-def load_environment():
-    """Load environment variables from .env file"""
-    try:
-        load_dotenv()
-        token = os.getenv('GOTIFY_TOKEN')
-        if not token:
-            raise ValueError("GOTIFY_TOKEN not found in .env file")
-        return token
-    except Exception as e:
-        logger.error(f"Failed to load environment variables: {e}")
-        raise
+# (connect, read) timeout in seconds for status API requests
+STATUS_TIMEOUT = (3.05, 10)
+
+# Session for the status API that retries transient failures with backoff
+_status_session = requests.Session()
+_status_session.mount('https://', HTTPAdapter(max_retries=Retry(
+    total=5,
+    backoff_factor=0.5,
+    status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=frozenset(["GET"]),
+    # Retry-After is uncapped in urllib3; ignore it so backoff_factor alone bounds the run time
+    respect_retry_after_header=False
+)))
 
 def get_status():
-    """Fetch status information from the API"""
+    """Fetch status information from the API, returning the parsed data and the raw body"""
     try:
-        response = requests.get('https://status.stoe.no/api/v1/status', timeout=10)
+        response = _status_session.get('https://status.stoe.no/api/v1/status', timeout=STATUS_TIMEOUT)
         response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
+        body = response.content
+        return json_loads(body), body
+    # orjson's and the stdlib's JSONDecodeError are both ValueError subclasses
+    except (requests.exceptions.RequestException, ValueError) as e:
         logger.error(f"Failed to fetch status data: {e}")
         raise
 
+@functools.lru_cache(maxsize=1)
+def _load_config_cached(mtime):
+    """Parse config.yaml; cached on its modification time so it is only re-read when it changes"""
+    with open("config.yaml", "r") as f:
+        config = yaml.load(f, Loader=SafeLoader)
+        logger.info("Configuration loaded successfully")
+        return config
+
 def load_config():
     """Load configuration from config.yaml file"""
     try:
         if os.path.exists("config.yaml"):
-            with open("config.yaml", "r") as f:
-                config = yaml.safe_load(f)
-                logger.info("Configuration loaded successfully")
-                return config
+            return _load_config_cached(os.path.getmtime("config.yaml"))
         else:
             logger.warning("config.yaml not found, using default settings")
             return {"components": []}
@@ -84,64 +164,112 @@ def load_config():
         return {"components": []}
 
 def load_state():
-    """Load previous state from state.json file"""
+    """Load previous state from state.json file, returning (component state, run metadata)"""
     try:
         if os.path.exists("state.json"):
-            with open("state.json", "r") as f:
-                return json.load(f)
+            with open("state.json", "rb") as f:
+                state = json_loads(f.read())
+            if "_meta" in state and isinstance(state.get("components"), dict):
+                return state["components"], state["_meta"]
+            # Older state files map component ids directly to their state
+            return state, {}
         else:
             logger.info("No previous state found, creating new state file")
-            return {}
+            return {}, {}
     except Exception as e:
         logger.error(f"Failed to load state: {e}")
-        return {}
+        return {}, {}
 
-def save_state(status_data):
-    """Save current state with timestamps for issues"""
+def content_hash(body):
+    """Hash a raw API response body so unchanged responses can be detected cheaply"""
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+def read_component(component, previous_state):
+    """Normalise a component from the status API and compare it with its previous state"""
+    component_id = str(component.get('id', 'unknown'))
+    status = component.get('status', 'unknown').lower()
+    prev_status = previous_state.get(component_id, {}).get('status')
+    return ComponentStatus(
+        id=component_id,
+        name=component.get('name', 'Unknown Component'),
+        status=status,
+        prev_status=prev_status,
+        is_operational=status == "operational",
+        was_operational=None if prev_status is None else prev_status == "operational"
+    )
+
+def save_state(components, previous_state, body_hash=None):
+    """Save current state with timestamps for issues, carried over from previous_state"""
     try:
-        current_state = load_state()
+        # Timestamps are shared by every component saved in this run
+        now_ts = time.time()
+        now_iso = datetime.fromtimestamp(now_ts).isoformat()
         new_state = {}
+        # Only remember the hash when the state reflects that exact API response
+        meta = {"last_hash": body_hash} if body_hash is not None else {}
         
-        for component in status_data:
-            component_id = component.get('id', 'unknown')
-            name = component.get('name', 'Unknown Component')
-            current_status = component.get('status', 'unknown').lower()
+        for component in components:
+            component_id = component.id
             
             # Update state with basic information
             new_state[component_id] = {
-                "name": name,
-                "status": current_status,
-                "last_updated": datetime.now().isoformat()
+                "name": component.name,
+                "status": component.status,
+                "last_updated": now_iso
             }
             
-            if component_id in current_state:
+            if component.was_operational is not None:
                 # If status changed from operational to non-operational, record start time
-                if (current_state[component_id].get('status') == 'operational' 
-                    and current_status != 'operational'):
-                    new_state[component_id]['issue_start'] = datetime.now().isoformat()
+                if component.was_operational and not component.is_operational:
+                    new_state[component_id]['issue_start'] = now_ts
                 # If status is still non-operational, keep the start time
-                elif current_status != 'operational' and 'issue_start' in current_state[component_id]:
-                    new_state[component_id]['issue_start'] = current_state[component_id]['issue_start']
+                elif not component.is_operational and 'issue_start' in previous_state[component_id]:
+                    new_state[component_id]['issue_start'] = previous_state[component_id]['issue_start']
             else:
                 # New component with issue
-                if current_status != 'operational':
-                    new_state[component_id]['issue_start'] = datetime.now().isoformat()
+                if not component.is_operational:
+                    new_state[component_id]['issue_start'] = now_ts
         
-        with open("state.json", "w") as f:
-            json.dump(new_state, f, indent=4)
+        # Write to a temporary file and rename it over state.json, so an interrupted
+        # write never leaves a truncated state file behind
+        with open("state.json.tmp", "wb") as f:
+            f.write(json_dumps({"_meta": meta, "components": new_state}))
+        os.replace("state.json.tmp", "state.json")
         logger.info("State saved successfully")
     except Exception as e:
         logger.error(f"Failed to save state: {e}")
 
-def format_duration(start_time_str):
-    """Format the duration since the start time"""
+def build_comp_cfg(component_config):
+    """Convert a single component entry from config.yaml into a CompCfg"""
+    notify_on = component_config.get('notify_on', DEFAULT_NOTIFY_ON)
+    # A single value may be written without a list, e.g. "notify_on: degradation"
+    if isinstance(notify_on, str):
+        notify_on = (notify_on,)
+    return CompCfg(
+        enabled=component_config.get('enabled', True),
+        notify_on=frozenset(notify_on or ()),
+        messages=component_config.get('messages') or {}
+    )
+
+def build_config_map(config):
+    """Create a mapping of component IDs to their pre-processed configuration"""
+    # Entries without an id can never match a component, so they are left out
+    return {
+        str(c['id']): build_comp_cfg(c)
+        for c in config.get('components') or ()
+        if c.get('id')
+    }
+
+def format_duration(start_ts):
+    """Format the duration since the start time, given as a unix timestamp"""
     try:
-        start_time = datetime.fromisoformat(start_time_str)
-        duration = datetime.now() - start_time
+        # State files written by older versions store the start time as an ISO string
+        if isinstance(start_ts, str):
+            start_ts = datetime.fromisoformat(start_ts).timestamp()
         
-        days = duration.days
-        hours = duration.seconds // 3600
-        minutes = (duration.seconds % 3600) // 60
+        days, remainder = divmod(int(time.time() - start_ts), 86400)
+        hours, remainder = divmod(remainder, 3600)
+        minutes = remainder // 60
         
         parts = []
         if days > 0:
@@ -167,18 +295,17 @@ def get_message(component_id, component_name, current_status, prev_status=None,
         current_status: Current status of the component
         prev_status: Previous status of the component (optional)
         message_type: Type of message ("degradation" or "recovery")
-        config_map: Mapping of component IDs to their configuration
+        config_map: Mapping of component IDs to their CompCfg
     
     Returns:
         tuple: (title, message) formatted with component information
     """
     # Format parameters for string substitution
-    format_params = {
-        "name": component_name,
-        "status": current_status,
-        "prev_status": prev_status if prev_status else "unknown",
-        "duration": ""
-    }
+    format_params = _SafeDict(
+        name=component_name,
+        status=current_status,
+        prev_status=prev_status if prev_status else "unknown"
+    )
     
     # Add duration for recovery messages
     if message_type == "recovery" and state and component_id in state:
@@ -192,105 +319,83 @@ def get_message(component_id, component_name, current_status, prev_status=None,
     
     # Default message template
     if message_type == "degradation":
-        message = DEFAULT_DEGRADATION_MESSAGE if prev_status else DEFAULT_NEW_ISSUE_MESSAGE
+        default_format = _DEGRADATION_FMT if prev_status else _NEW_ISSUE_FMT
     else:  # recovery
-        message = DEFAULT_RECOVERY_MESSAGE
+        default_format = _RECOVERY_FMT
     
     # Try to get custom message from config
     if config_map and component_id in config_map:
-        component_config = config_map[component_id]
-        if 'messages' in component_config and message_type in component_config['messages']:
-            custom_message = component_config['messages'][message_type]
-            if custom_message:
-                logger.info(f"Using custom {message_type} message for {component_name}")
-                message = custom_message
-                return title, custom_message.format(**format_params)
+        custom_message = config_map[component_id].messages.get(message_type)
+        if custom_message:
+            logger.info(f"Using custom {message_type} message for {component_name}")
+            return title, custom_message.format_map(format_params)
     
-    return title, message.format(**format_params)
+    return title, default_format(format_params)
 
-def check_components(status_data, notification_provider):
+def check_components(status_data, notification_provider, raw_body=None):
     """Check each component's status and send notifications for issues"""
     try:
         # Load previous state and configuration
-        previous_state = load_state()
+        previous_state, meta = load_state()
+        
+        # Nothing can have changed if the API returned the same response as last run
+        body_hash = content_hash(raw_body) if raw_body is not None else None
+        if body_hash is not None and body_hash == meta.get("last_hash"):
+            logger.info("Status data unchanged since last run")
+            return
+        
         config = load_config()
         issues_found = False
+        pending = []
         
         # Create a mapping of component IDs to their configuration
-        config_map = {}
-        for component_config in config.get('components', []):
-            config_map[component_config.get('id')] = component_config
+        config_map = build_config_map(config)
+        
+        # Normalise each component and compare it with the previous state once
+        components = [read_component(component, previous_state) for component in status_data]
         
-        for component in status_data:
-            component_id = component.get('id', 'unknown')
-            name = component.get('name', 'Unknown Component')
-            status = component.get('status', 'unknown').lower()
-            logger.info(f"Component: {name}, Status: {status}")
+        for component in components:
+            component_id = component.id
+            name = component.name
+            logger.info(f"Component: {name}, Status: {component.status}")
             
             # Check if component is in config, if not use default settings
-            component_config = config_map.get(component_id, {
-                "enabled": True,
-                "notify_on": ["degradation", "recovery"]
-            })
+            component_config = config_map.get(component_id, DEFAULT_COMP_CFG)
             
             # Skip if notifications are disabled for this component
-            if not component_config.get('enabled', True):
+            if not component_config.enabled:
                 logger.info(f"Skipping notifications for {name} (disabled in config)")
                 continue
                 
             # Get notification preferences
-            notify_on = component_config.get('notify_on', ["degradation", "recovery"])
+            notify_on = component_config.notify_on
             
-            # Check if status has changed
-            if component_id in previous_state:
-                prev_status = previous_state[component_id]["status"]
-                
-                # Check for degradation (was operational, now it's not)
-                if prev_status == "operational" and status != "operational" and "degradation" in notify_on:
-                    issues_found = True
-                    title, message = get_message(
-                        component_id, 
-                        name, 
-                        status, 
-                        prev_status, 
-                        "degradation", 
-                        config_map,
-                        previous_state
-                    )
-                    notification_provider.send_notification(title, message)
-                
-                # Check for recovery (was not operational, now it is)
-                elif prev_status != "operational" and status == "operational" and "recovery" in notify_on:
-                    title, message = get_message(
-                        component_id, 
-                        name, 
-                        status, 
-                        prev_status, 
-                        "recovery", 
-                        config_map,
-                        previous_state
-                    )
-                    notification_provider.send_notification(title, message)
+            # Check if status has changed; new components have no previous status
+            event = _TRANSITIONS[(component.was_operational, component.is_operational)]
+            if event is None or event not in notify_on:
+                continue
             
-            # For new components or first run, notify if not operational
-            elif status != "operational" and "degradation" in notify_on:
+            if event == "degradation":
                 issues_found = True
-                title, message = get_message(
-                    component_id, 
-                    name, 
-                    status, 
-                    None,  # No previous status for new components 
-                    "degradation", 
-                    config_map,
-                    previous_state
-                )
-                notification_provider.send_notification(title, message)
+            title, message = get_message(
+                component_id, 
+                name, 
+                component.status, 
+                component.prev_status, 
+                event, 
+                config_map,
+                previous_state
+            )
+            pending.append((title, message))
         
         if not issues_found:
             logger.info("All components are operational")
         
+        # Queue notifications in the background so saving state doesn't wait on the provider
+        notification_provider.send_batch(pending)
+        
         # Save the updated state
-        save_state(status_data)
+        save_state(components, previous_state, body_hash)
             
     except Exception as e:
         logger.error(f"Error checking components: {e}")
@@ -301,8 +406,8 @@ def test_status_changes(original_data):
     Create a modified copy of the status data with one component's status changed.
     Used for testing status change notifications.
     """
-    # Create a deep copy of the original data
-    modified_data = copy.deepcopy(original_data)
+    # Copy each component; only the top-level status is modified, so a shallow copy is enough
+    modified_data = [dict(component) for component in original_data]
     
     # Change the status of the first component if available
     if modified_data and len(modified_data) > 0:
@@ -317,6 +422,7 @@ def test_status_changes(original_data):
     return modified_data
 def main():
     """Main function to execute the status check"""
+    notification_provider = None
     try:
         # Parse command-line arguments
         parser = argparse.ArgumentParser(description="Status checker for stoe.no")
@@ -333,8 +439,8 @@ def main():
             
             # Test 1: Initial check
             logger.info("Test 1: Checking current status (baseline)")
-            status_data = get_status()
-            check_components(status_data, notification_provider)
+            status_data, raw_body = get_status()
+            check_components(status_data, notification_provider, raw_body)
             
             # Test 2: Simulate BankID failure
             logger.info("Test 2: Simulating BankID failure")
@@ -368,22 +474,24 @@ def main():
             logger.info("Test sequence completed")
         else:
             # Normal operation - Get status data
-            status_data = get_status()
+            status_data, raw_body = get_status()
             
             # Check components and send notifications
-            check_components(status_data, notification_provider)
+            check_components(status_data, notification_provider, raw_body)
     except Exception as e:
         logger.error(f"Script execution failed: {e}")
         # Optionally, send a notification about the script failure
-        try:
-            error_config = load_config()
-            error_notification_provider = get_notification_provider(error_config)
-            error_notification_provider.send_notification(
-                "Status Checker Error",
-                f"The status checker script encountered an error: {str(e)}"
-            )
-        except Exception:
-            logger.error("Failed to send error notification")
+        if notification_provider is not None:
+            try:
+                notification_provider.send_notification(
+                    "Status Checker Error",
+                    f"The status checker script encountered an error: {str(e)}"
+                )
+            except Exception:
+                logger.error("Failed to send error notification")
+    finally:
+        if notification_provider is not None:
+            notification_provider.close()
 
 if __name__ == "__main__":
     main()